@@ -1,116 +1,410 @@
 import streamlit as st
 import ollama
-import base64
+import pybase64
 import os
-import json
+import orjson
 import time
 import re
+import string
+import queue
+import threading
+import atexit
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from uuid import uuid4
 from datetime import datetime
+from PIL import Image
 
 # --- Configuration ---
 MODEL_NAME = 'gemma3'
 CHAT_SESSIONS_DIR = "chat_sessions"
+# Uploaded images live on disk and histories only store their path; the
+# directory is shared because a chat has no id until its first exchange.
+IMAGES_DIR = os.path.join(CHAT_SESSIONS_DIR, "images")
+KEEP_ALIVE = '30m'  # Keep the model loaded between turns so Ollama's prompt cache stays warm
+RECENT_SESSIONS_LIMIT = 20  # Sidebar chats shown up front; the rest sit in a collapsed expander
+FSYNC_EVERY = 10  # fsync the history log every N background writes to amortize the syscall
+MAX_IMAGE_EDGE = 1024  # Long-edge cap for uploaded images before they reach the model
+JPEG_QUALITY = 85
+MAX_CONTEXT_MESSAGES = 20  # Summarize old turns once the un-summarized history grows past this
+SUMMARY_KEEP_RECENT = 10   # How many recent messages to keep verbatim after summarizing
+
+# --- Background writer so history saves never block the UI thread ---
+
+_write_queue = queue.Queue()
+_dirty_paths = set()  # Files appended to since their last fsync
+_write_error = None
+
+def _write_worker():
+    global _write_error
+    writes = 0
+    while True:
+        filepath, data = _write_queue.get()
+        try:
+            # A 64 KiB buffer lets each queued delta land as one physical
+            # write, which matters on networked filesystems.
+            with open(filepath, "ab", buffering=1 << 16) as f:
+                f.write(data)
+                _dirty_paths.add(filepath)
+                writes += 1
+                if writes % FSYNC_EVERY == 0:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    _dirty_paths.discard(filepath)
+        except Exception as e:
+            # The worker must survive I/O failures (disk full, permissions,
+            # directory removed); stash the error for the script thread to
+            # surface, since st.* can't be called from here.
+            _write_error = e
+        finally:
+            _write_queue.task_done()
+
+_write_thread = threading.Thread(target=_write_worker, daemon=True)
+_write_thread.start()
+
+def flush_pending_writes():
+    """Blocks until every queued history write has hit the filesystem."""
+    _write_queue.join()
+
+def report_write_error():
+    """Surfaces any stashed writer-thread failure; runs on the script thread."""
+    global _write_error
+    if _write_error is not None:
+        st.error(f"Error saving chat history: {_write_error}")
+        _write_error = None
+
+def _sync_on_exit():
+    """Drains the write queue and forces every unsynced log tail to disk."""
+    flush_pending_writes()
+    while _dirty_paths:
+        path = _dirty_paths.pop()
+        if os.path.exists(path):
+            with open(path, "ab") as f:
+                os.fsync(f.fileno())
+
+atexit.register(_sync_on_exit)
 
 # --- Helper Functions for File-based History ---
 
 def setup_app():
     """Initializes the app environment, like creating the session directory."""
+    # Reruns skip the directory and session-state setup entirely
+    if st.session_state.get("app_ready"):
+        return
     os.makedirs(CHAT_SESSIONS_DIR, exist_ok=True)
-    # Initialize session state variables if they don't exist
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-    if "active_chat_id" not in st.session_state:
-        st.session_state.active_chat_id = None
-    if "response_time" not in st.session_state:
-        st.session_state.response_time = None
-    if "ollama_model" not in st.session_state:
-        st.session_state.ollama_model = MODEL_NAME
-    if "staged_image" not in st.session_state:
-        st.session_state.staged_image = None
-    if "uploader_key" not in st.session_state:
-        st.session_state.uploader_key = 0
-
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    st.session_state.messages = []
+    st.session_state.active_chat_id = None
+    st.session_state.response_time = None
+    st.session_state.first_token_time = None
+    st.session_state.ollama_model = MODEL_NAME
+    st.session_state.staged_image = None
+    st.session_state.uploader_key = 0
+    st.session_state.persisted_count = 0
+    st.session_state.summary = None
+    st.session_state.summary_cutoff = 0
+    st.session_state.app_ready = True
+
+@st.cache_data(ttl=60)
 def get_chat_sessions():
-    """Returns a sorted list of chat session files."""
-    files = [f for f in os.listdir(CHAT_SESSIONS_DIR) if f.endswith(".json")]
-    return sorted(files, key=lambda x: os.path.getmtime(os.path.join(CHAT_SESSIONS_DIR, x)), reverse=True)
+    """Returns a sorted tuple of chat session files.
+
+    Cached so reruns skip the directory scan entirely; callers that
+    create, delete or rename a session must call get_chat_sessions.clear().
+    """
+    # scandir gives us the mtime from the cached directory entry,
+    # avoiding a separate stat call per file on every rerun.
+    with os.scandir(CHAT_SESSIONS_DIR) as it:
+        entries = [(e.name, e.stat().st_mtime) for e in it if e.name.endswith(".jsonl")]
+    return tuple(name for name, _ in sorted(entries, key=lambda x: -x[1]))
 
 def load_chat_history(chat_id):
-    """Loads the chat history from a JSON file."""
+    """Loads the chat history from a JSONL file, one message per line."""
+    flush_pending_writes()
     filepath = os.path.join(CHAT_SESSIONS_DIR, chat_id)
     if os.path.exists(filepath):
-        with open(filepath, "r", encoding="utf-8") as f:
-            return json.load(f)
+        history = []
+        valid_bytes = 0
+        with open(filepath, "r+b") as f:
+            for line in f:
+                try:
+                    history.append(orjson.loads(line))
+                except orjson.JSONDecodeError:
+                    # A crash mid-append can leave a truncated final line;
+                    # drop it and cut the file back to the last good line,
+                    # otherwise the next append would extend the fragment
+                    # into one unparseable line and lose a real message.
+                    f.truncate(valid_bytes)
+                    break
+                valid_bytes += len(line)
+        return history
     return []
 
+def model_message(message):
+    """Converts a stored message into the dict sent to Ollama.
+
+    Messages referencing an image on disk get the bytes read and
+    b64-encoded on demand; everything else passes through unchanged.
+    """
+    if "image_path" in message:
+        converted = {k: v for k, v in message.items() if k != "image_path"}
+        converted["images"] = [pybase64.b64encode_as_string(read_image_bytes(message["image_path"]))]
+        return converted
+    return message
+
 def save_chat_history(chat_id, history):
-    """Write a chat history file."""
+    """Queues any messages not yet on disk for appending to the chat's JSONL file."""
     filepath = os.path.join(CHAT_SESSIONS_DIR, chat_id)
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(history, f, indent=4)
+    data = b"".join(
+        orjson.dumps(message) + b"\n"
+        for message in history[st.session_state.persisted_count:]
+    )
+    if data:
+        _write_queue.put((filepath, data))
+    st.session_state.persisted_count = len(history)
+    get_chat_sessions.clear()
 
 def delete_chat_history(chat_id):
-    """Deletes a chat history file."""
+    """Deletes a chat history file and any images it references."""
+    flush_pending_writes()
     filepath = os.path.join(CHAT_SESSIONS_DIR, chat_id)
     if os.path.exists(filepath):
+        for message in load_chat_history(chat_id):
+            image_path = message.get("image_path")
+            if image_path and os.path.exists(image_path):
+                os.remove(image_path)
         os.remove(filepath)
+    get_chat_sessions.clear()
 
+@functools.lru_cache(maxsize=1024)
 def format_filename_for_display(filename):
     """Makes the filename more readable for the UI."""
-    # Remove .json and replace underscores with spaces
-    return filename.replace(".json", "").replace("_", " ").capitalize()
+    # Remove .jsonl and replace underscores with spaces
+    return filename.replace(".jsonl", "").replace("_", " ").capitalize()
 
 # --- NEW: Function to sanitize the topic for use as a filename ---
+
+# Precompiled at import so each call skips the re-cache lookup
+_RE_ILLEGAL = re.compile(r'[^\w\s-]')
+_RE_WS = re.compile(r'\s+')
+
+# Deletion table for the ASCII fast path: drop anything that is not a
+# letter, digit, whitespace, hyphen or underscore via a C-level lookup
+_KEEP = set(string.ascii_letters + string.digits + string.whitespace + '-_')
+_SANITIZE_TBL = {i: None for i in range(128) if chr(i) not in _KEEP}
+
 def sanitize_filename(topic):
     """Removes illegal characters from a string so it can be a valid filename."""
-    # Remove any character that is not a letter, number, space, hyphen, or underscore
-    sanitized_topic = re.sub(r'[^\w\s-]', '', topic).strip()
+    if topic.isascii():
+        # str.translate beats the regex engine for pure-ASCII topics
+        sanitized_topic = topic.translate(_SANITIZE_TBL).strip()
+    else:
+        # Remove any character that is not a letter, number, space, hyphen, or underscore
+        sanitized_topic = _RE_ILLEGAL.sub('', topic).strip()
     # Replace spaces with underscores
-    sanitized_topic = re.sub(r'\s+', '_', sanitized_topic)
+    sanitized_topic = _RE_WS.sub('_', sanitized_topic)
     # Truncate to a reasonable length
     return sanitized_topic[:50] if sanitized_topic else "new_chat"
 
+# A single worker is enough: at most one topic request is in flight per turn.
+_topic_executor = ThreadPoolExecutor(max_workers=1)
+
 # --- CORRECTED: Function to generate a topic for the chat ---
-def generate_chat_topic(messages):
-    """Asks the LLM to generate a short topic for the conversation."""
-    # Create a copy of the messages to avoid modifying the original list
-    history = messages.copy()
-    
+def generate_chat_topic(messages, model, client):
+    """Asks the LLM to generate a short topic for the conversation.
+
+    Runs on the topic executor thread, so it must not touch st.* APIs;
+    the caller resolves the pooled client and any image paths (via
+    model_message, whose helpers are st.cache_data-backed) on the
+    script thread and passes plain values in.
+    """
+    # The first user/assistant exchange is enough to name the chat
+    history = list(messages[:2])
+
     # Add a specific instruction to generate a topic
     history.append({
         "role": "user",
         "content": "Based on our conversation so far, what is a short, descriptive topic for this chat? "
                    "The topic should be less than 10 words. Reply with only the topic itself, and nothing else."
     })
-    
+
+    try:
+        response = client.chat(
+            model=model,
+            messages=history,
+            keep_alive=KEEP_ALIVE,
+            options={"num_predict": 20}  # The topic is <10 words, so cap output tokens
+        )
+        return response['message']['content']
+    except Exception:
+        return "Chat" # Fallback topic
+
+@st.cache_resource
+def get_ollama_client():
+    """One pooled Ollama client shared across reruns.
+
+    ollama.Client keeps a persistent HTTP session, so reusing it avoids a
+    fresh TCP handshake to the Ollama server on every call.
+    """
+    return ollama.Client()
+
+@st.cache_data(show_spinner=False)
+def decode_image(b64_string):
+    """Decodes an image's b64 string, cached so reruns don't repeat the work."""
+    return pybase64.b64decode(b64_string)
+
+@st.cache_data(show_spinner=False)
+def prepare_image(img_data):
+    """Downscales an upload to MAX_IMAGE_EDGE and re-encodes it as JPEG.
+
+    Multimodal inputs are token-expensive, so shrinking oversized uploads
+    cuts the bytes sent to the model, the file stored on disk and the
+    base64 work proportionally. Returns (bytes, extension); cached so the
+    rerun triggered by staging doesn't resize the same upload twice.
+    """
+    img = Image.open(BytesIO(img_data))
+    if max(img.size) <= MAX_IMAGE_EDGE and img.format == "JPEG":
+        return img_data, ".jpg"
+    img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    buf = BytesIO()
+    img.save(buf, "JPEG", quality=JPEG_QUALITY)
+    return buf.getvalue(), ".jpg"
+
+@st.cache_data(show_spinner=False)
+def read_image_bytes(image_path):
+    """Reads an image file from disk, cached so reruns don't repeat the I/O."""
+    with open(image_path, "rb") as f:
+        return f.read()
+
+# --- Context management to keep per-turn prefill cost bounded ---
+
+def summarize_messages(previous_summary, messages):
+    """Asks the LLM to fold newly aged-out turns into the running summary.
+
+    Only the previous summary plus the new slice is sent, so the cost of
+    a summarize call stays bounded no matter how long the chat gets.
+    """
+    history = [model_message(m) for m in messages]
+    if previous_summary:
+        history.insert(0, {
+            "role": "system",
+            "content": f"Summary of the conversation so far: {previous_summary}"
+        })
+    history.append({
+        "role": "user",
+        "content": "Summarize the conversation above in a few sentences, folding it into the "
+                   "earlier summary if one was given and keeping any facts, names or decisions "
+                   "that later replies might need. Reply with only the summary."
+    })
     try:
-        response = ollama.chat(
+        response = get_ollama_client().chat(
             model=st.session_state.ollama_model,
-            messages=history
+            messages=history,
+            keep_alive=KEEP_ALIVE
         )
         return response['message']['content']
     except Exception as e:
-        st.error(f"Error generating topic: {e}")
-        return "Chat" # Fallback topic
+        st.error(f"Error summarizing conversation: {e}")
+        return None
+
+def build_model_messages(messages):
+    """Returns the message list to send to the model.
+
+    Turns already folded into the rolling summary are replaced by a
+    single summary message, so per-turn prefill stays bounded instead of
+    growing with chat length. Refreshing the summary itself happens in
+    maybe_update_summary, after the turn completes.
+    """
+    cutoff = st.session_state.summary_cutoff
+    model_messages = [model_message(m) for m in messages[cutoff:]]
+    if cutoff:
+        model_messages.insert(0, {
+            "role": "system",
+            "content": f"Summary of the conversation so far: {st.session_state.summary}"
+        })
+    return model_messages
+
+def maybe_update_summary(messages):
+    """Folds aged-out turns into the rolling summary once the
+    un-summarized history grows past MAX_CONTEXT_MESSAGES.
+
+    Called after the response has been rendered, so the user never waits
+    on the summarize call before seeing an answer.
+    """
+    cutoff = st.session_state.summary_cutoff
+    if len(messages) - cutoff <= MAX_CONTEXT_MESSAGES:
+        return
+    new_cutoff = len(messages) - SUMMARY_KEEP_RECENT
+    summary = summarize_messages(st.session_state.summary, messages[cutoff:new_cutoff])
+    if summary is not None:
+        st.session_state.summary = summary
+        st.session_state.summary_cutoff = new_cutoff
+
+# --- Sidebar callbacks ---
+# Run as on_click handlers before the script reruns, so the rerun that
+# Streamlit already performs for the click renders the updated state and
+# no explicit st.rerun() round-trip is needed.
+
+def clear_staged_image():
+    if st.session_state.staged_image:
+        st.session_state.staged_image = None
+        st.session_state.uploader_key += 1
+
+def start_new_chat():
+    st.session_state.messages = []
+    st.session_state.active_chat_id = None
+    st.session_state.persisted_count = 0
+    st.session_state.summary = None
+    st.session_state.summary_cutoff = 0
+    st.session_state.recent_session_choice = None
+    st.session_state.older_session_choice = None
+    clear_staged_image()
+
+def select_chat(session_id):
+    st.session_state.response_time = None
+    st.session_state.first_token_time = None
+    st.session_state.active_chat_id = session_id
+    st.session_state.messages = load_chat_history(session_id)
+    st.session_state.persisted_count = len(st.session_state.messages)
+    st.session_state.summary = None
+    st.session_state.summary_cutoff = 0
+    clear_staged_image()
+
+def delete_chat(session_id):
+    delete_chat_history(session_id)
+    if st.session_state.active_chat_id == session_id:
+        st.session_state.response_time = None
+        st.session_state.first_token_time = None
+        start_new_chat()
+
+def select_chat_from(widget_key, other_key):
+    """on_change handler for the history radios.
+
+    Fires only on real user picks, so programmatic changes to the active
+    chat never bounce back through here. Clears the other radio so at
+    most one section shows a selection.
+    """
+    session_id = st.session_state[widget_key]
+    st.session_state[other_key] = None
+    if session_id and session_id != st.session_state.active_chat_id:
+        select_chat(session_id)
 
 # --- Main Streamlit App ---
 
 def main():
     st.set_page_config(page_title="Wandee AI Pro", page_icon="🤖", layout="wide")
     setup_app()
+    report_write_error()
 
     # --- Sidebar for Chat Management ---
     with st.sidebar:
         st.title("🤖 Wandee AI Pro")
         st.write("---")
 
-        if st.button("➕ New Chat"):
-            st.session_state.messages = []
-            st.session_state.active_chat_id = None
-            if st.session_state.staged_image:
-                st.session_state.staged_image = None
-                st.session_state.uploader_key += 1
-            st.rerun()
+        st.button("➕ New Chat", on_click=start_new_chat)
 
         st.header("Chat History")
         chat_sessions = get_chat_sessions()
@@ -118,37 +412,38 @@ def main():
         if not chat_sessions:
             st.caption("No chat history found.")
         else:
-            for session_id in chat_sessions:
-                col1, col2 = st.columns([5, 1])
-                with col1:
-                    if st.button(format_filename_for_display(session_id), key=f"select_{session_id}", use_container_width=True):
-                        st.session_state.response_time = None
-                        st.session_state.active_chat_id = session_id
-                        st.session_state.messages = load_chat_history(session_id)
-                        if st.session_state.staged_image:
-                            st.session_state.staged_image = None
-                            st.session_state.uploader_key += 1
-                        st.rerun()
-                with col2:
-                    if st.button("🗑️", key=f"delete_{session_id}", help=f"Delete chat: {format_filename_for_display(session_id)}"):
-                        delete_chat_history(session_id)
-                        if st.session_state.active_chat_id == session_id:
-                            st.session_state.response_time = None
-                            st.session_state.active_chat_id = None
-                            st.session_state.messages = []
-                            if st.session_state.staged_image:
-                                st.session_state.staged_image = None
-                                st.session_state.uploader_key += 1
-                        st.rerun()
+            # One radio per section replaces two widgets per chat, so the
+            # sidebar marshals a constant number of widgets no matter how
+            # many chats exist; older chats stay behind an expander.
+            recent_sessions = list(chat_sessions[:RECENT_SESSIONS_LIMIT])
+            older_sessions = list(chat_sessions[RECENT_SESSIONS_LIMIT:])
+            st.radio("Recent chats", recent_sessions, index=None,
+                     format_func=format_filename_for_display,
+                     label_visibility="collapsed",
+                     key="recent_session_choice",
+                     on_change=select_chat_from,
+                     args=("recent_session_choice", "older_session_choice"))
+            if older_sessions:
+                with st.expander(f"Older chats ({len(older_sessions)})"):
+                    st.radio("Older chats", older_sessions, index=None,
+                             format_func=format_filename_for_display,
+                             label_visibility="collapsed",
+                             key="older_session_choice",
+                             on_change=select_chat_from,
+                             args=("older_session_choice", "recent_session_choice"))
+            if st.session_state.active_chat_id:
+                with st.expander("Delete current chat"):
+                    st.button("🗑️ Delete", key="delete_active",
+                              help=f"Delete chat: {format_filename_for_display(st.session_state.active_chat_id)}",
+                              on_click=delete_chat, args=(st.session_state.active_chat_id,))
 
         st.write("---")
         st.header("Image Attachment")        
         image_input = st.file_uploader("Attach an image", type=["jpg", "jpeg", "png", "gif"], key=st.session_state.uploader_key)
 
         if image_input:
-            img_data = image_input.getvalue()
-            base64_img = base64.b64encode(img_data).decode('utf-8')
-            st.session_state.staged_image = {"b64": base64_img, "bytes": img_data}
+            img_data, extension = prepare_image(image_input.getvalue())
+            st.session_state.staged_image = {"bytes": img_data, "ext": extension}
 
         # Display the staged image in the sidebar so the user knows it's ready.
         if st.session_state.staged_image:
@@ -165,16 +460,22 @@ def main():
     # Display chat messages
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
-            if message["role"] == "user" and "images" in message and message["images"]:
+            if message["role"] == "user" and ("image_path" in message or message.get("images")):
                 st.markdown(message["content"])
-                b64_img_string = message["images"][0] 
-                image_bytes = base64.b64decode(b64_img_string)
+                if "image_path" in message:
+                    image_bytes = read_image_bytes(message["image_path"])
+                else:
+                    # Histories from before image files were split out still carry b64 inline.
+                    image_bytes = decode_image(message["images"][0])
                 st.image(image_bytes, caption="Attached Image", width=150)
             else:
                 st.markdown(message["content"])
 
     if st.session_state.response_time:
-        st.markdown(f"\n\n*<center><small>Last response time: {st.session_state.response_time}s</small></center>*", unsafe_allow_html=True)
+        timing = f"Last response time: {st.session_state.response_time}s"
+        if st.session_state.first_token_time:
+            timing += f" (first token: {st.session_state.first_token_time}s)"
+        st.markdown(f"\n\n*<center><small>{timing}</small></center>*", unsafe_allow_html=True)
 
     # Handle user input
     if prompt := st.chat_input("What would you like to ask?"):
@@ -186,7 +487,10 @@ def main():
         # Check for a staged image and attach it to the message
         if st.session_state.staged_image:
             image_was_sent = True
-            user_message["images"] = [st.session_state.staged_image["b64"]]
+            image_path = os.path.join(IMAGES_DIR, f"img_{uuid4().hex[:8]}{st.session_state.staged_image['ext']}")
+            with open(image_path, "wb") as f:
+                f.write(st.session_state.staged_image["bytes"])
+            user_message["image_path"] = image_path
 
         st.session_state.messages.append(user_message)
 
@@ -197,38 +501,66 @@ def main():
             if image_was_sent:
                 st.image(st.session_state.staged_image["bytes"], width=150)
 
-        # Get and display assistant response
+        # Get and display assistant response, streaming tokens as they arrive
         with st.chat_message("assistant"):
-            with st.spinner("Wandee is thinking...", show_time=True):
-                start_time = time.time()
-                response = ollama.chat(
-                    model=st.session_state.ollama_model,
-                    messages=st.session_state.messages
-                )
-                end_time = time.time()
-                st.session_state.response_time = round(end_time - start_time, 1)
-                assistant_response = response['message']['content']
+            start_time = time.time()
+            stream = get_ollama_client().chat(
+                model=st.session_state.ollama_model,
+                messages=build_model_messages(st.session_state.messages),
+                stream=True,
+                keep_alive=KEEP_ALIVE
+            )
+
+            def token_stream():
+                for chunk in stream:
+                    if st.session_state.first_token_time is None:
+                        st.session_state.first_token_time = round(time.time() - start_time, 1)
+                    yield chunk['message']['content']
+
+            st.session_state.first_token_time = None
+            assistant_response = st.write_stream(token_stream())
+            st.session_state.response_time = round(time.time() - start_time, 1)
 
         # Append assistant response and save history
         assistant_message = {"role": "assistant", "content": assistant_response}
         st.session_state.messages.append(assistant_message)
 
         # --- LOGIC FOR NEW CHAT TOPIC GENERATION ---
-        # Check if this is the first exchange in a new chat
+        # For a new chat, kick off topic generation in the background and
+        # save under a placeholder name, so the disk write overlaps the
+        # extra LLM round-trip instead of serializing behind it.
+        topic_future = None
         if st.session_state.active_chat_id is None:
-            topic = generate_chat_topic(st.session_state.messages)
-            sanitized_topic = sanitize_filename(topic)
-                # Ensure the filename is unique
-            new_chat_id = f"{sanitized_topic}.json"
-            i = 1
-            while os.path.exists(os.path.join(CHAT_SESSIONS_DIR, new_chat_id)):
-                new_chat_id = f"{sanitized_topic}_{i}.json"
-                i += 1
-            st.session_state.active_chat_id = new_chat_id
-        
+            topic_future = _topic_executor.submit(
+                generate_chat_topic,
+                [model_message(m) for m in st.session_state.messages[:2]],
+                st.session_state.ollama_model,
+                get_ollama_client()
+            )
+            st.session_state.active_chat_id = f"new_chat_{uuid4().hex[:8]}.jsonl"
+
         # Save the history and rerun the app to update the sidebar
         save_chat_history(st.session_state.active_chat_id, st.session_state.messages)
 
+        # Rename the placeholder file once the topic arrives; the queued
+        # write must land before the file can be moved.
+        if topic_future is not None:
+            flush_pending_writes()
+            sanitized_topic = sanitize_filename(topic_future.result())
+                # Ensure the filename is unique with a single random
+                # suffix instead of probing _1, _2, ... with stat calls
+            new_chat_id = f"{sanitized_topic}.jsonl"
+            if os.path.exists(os.path.join(CHAT_SESSIONS_DIR, new_chat_id)):
+                new_chat_id = f"{sanitized_topic}_{uuid4().hex[:6]}.jsonl"
+            os.replace(os.path.join(CHAT_SESSIONS_DIR, st.session_state.active_chat_id),
+                       os.path.join(CHAT_SESSIONS_DIR, new_chat_id))
+            st.session_state.active_chat_id = new_chat_id
+            get_chat_sessions.clear()
+
+        # Fold aged-out turns into the rolling summary now that the
+        # response is already on screen
+        maybe_update_summary(st.session_state.messages)
+
         # --- MODIFICATION: The final step to clear the uploader ---
         if image_was_sent:
             st.session_state.staged_image = None